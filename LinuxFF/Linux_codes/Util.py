@@ -1,93 +1,94 @@
 import csv
+import os
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from itertools import islice, repeat
 from scipy.signal import find_peaks
 import numpy as np
 import Procedure
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
+try:
+    from peaks_kernel import welford_std, peak_bounds
+except ImportError:
+    # peaks_kernel.pyx hasn't been built (python setup.py build_ext --inplace), use NumPy equivalents
+    def welford_std(val):
+        return float(np.std(val)) if len(val) else 0.0
 
-def val_check(arr, index, threshold): 
-    result = []
-    right_indeces = []
-    left_indeces = []
+    def peak_bounds(arr, peaks, thr_offset, max_right=10):
+        starts = np.empty(len(peaks), dtype=np.int32)
+        ends = np.empty(len(peaks), dtype=np.int32)
+        for n, idx in enumerate(peaks):
+            thr = arr[idx] - thr_offset
+            left = arr[:idx][::-1] > thr
+            starts[n] = idx - (len(left) if left.all() else int(left.argmin()))
+            right = arr[(idx+1):(idx+1+max_right)] > thr
+            ends[n] = idx + (len(right) if right.all() else int(right.argmin()))
+        return starts, ends
 
-    for i in range((index-1), 1):
-        if arr[i] > threshold:
-            left_indeces.append(i)
-        else:
-            break
-    for i in range((index+1), len(arr)):
-        if arr[i] > threshold:
-            if len(right_indeces) < 10:
-                right_indeces.append(i)
-            else:
+# Find the peaks for a single miRNA, kept as parallel arrays until the CSV is written
+def key_peaks(key, val, original_record_dict, inv_reads):
+    # One conversion per key, a no-op for seq_aligner's float64 vectors. float32 would be
+    # upcast again inside find_peaks and costs precision in the 4-decimal RPM column.
+    val = np.ascontiguousarray(val, dtype=np.float64)
+    standard_deviation = welford_std(val)
+    thr_offset = standard_deviation*0.1
+    prominence = standard_deviation*0.85
+    peaks, _ = find_peaks(val, prominence=prominence, distance=18)
+    # The RPM cutoff stays after find_peaks: passed as height= it would run before the
+    # distance filter and change which of two equal-height neighbours is kept
+    rpms = np.round(val[peaks]*inv_reads, 4)
+    keep = rpms > 5.0
+    peaks = peaks[keep]
+    rpms = rpms[keep]
+    starts, ends = peak_bounds(val, peaks, thr_offset)
+    ends += 18
+    # Empty DB records get a zero-length vector but no entry in original_record_dict
+    if len(peaks) == 0:
+        return key, rpms, starts, ends, []
+    rec = original_record_dict[key]
+    seqs = [rec[peak_start:peak_end] for peak_start, peak_end in zip(starts.tolist(), ends.tolist())]
+    return key, rpms, starts, ends, seqs
+
+
+# Run key_peaks over a chunk of (key, val) pairs in one worker
+def chunk_peaks(items, original_record_dict, inv_reads):
+    return [key_peaks(key, val, original_record_dict, inv_reads) for key, val in items]
+
+
+# Find peaks for every key in small chunks of keys (the kernels release the GIL).
+# At most two chunks per core are in flight, so finished-but-unwritten results stay bounded;
+# results are yielded in key order.
+def collect_peaks(results_dict, original_record_dict, inv_reads, chunk_size=64):
+    workers = os.cpu_count() or 1
+    items = iter(results_dict.items())
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            while len(pending) < 2*workers:
+                chunk = list(islice(items, chunk_size))
+                if not chunk:
+                    break
+                pending.append(pool.submit(chunk_peaks, chunk, original_record_dict, inv_reads))
+            if not pending:
                 break
-        else:
-            break
-    if not right_indeces:
-        right_indeces.append(index)
-    if not left_indeces:
-        left_indeces.append(index)
-        
-    result.append(min(left_indeces))
-    result.append(max(right_indeces))
-    return result
+            yield from pending.popleft().result()
 
 
-def get_peaks(results_dict, original_record_dict, fasta_read_counts, fasta_file_name, db_file_name):
-    peaks_list = []
-    out_file = f"{fasta_file_name}({db_file_name}).csv"
-    for key, val in results_dict.items():
-        standard_deviation = np.std(val)
-        peaks, _ = find_peaks(val, prominence=standard_deviation*0.85, distance=18)
-        t = val
-        for i in peaks:
-            rpm = (val[i]/fasta_read_counts)*1000000
-            round_rpm = round(rpm, 4)
-            if round_rpm > 5.0:
-                peak_slice = val_check(val, i, (val[i]-(standard_deviation*0.1)))
-                peak_start = peak_slice[0]
-                peak_end = peak_slice[-1] + 18
-                peak_string = original_record_dict[key][peak_start:peak_end]
-                temp = [key, round_rpm, peak_start, peak_end, peak_string, '', out_file]
-                peaks_list.append(temp)
-            else:
-                continue
+# Expand one key's peak arrays into CSV rows
+def peak_rows(key, rpms, starts, ends, seqs, out_file):
+    return zip(repeat(key), rpms.tolist(), starts.tolist(), ends.tolist(), seqs, repeat(''), repeat(out_file))
 
-    with open(out_file, 'w') as f:
-        fields = ['miRNA ID', 'Reads per Million', 'Peak Start', 'Peak End', 'Peak Data', 'Total Reads in NGS File', 'File Name']
-        writer = csv.writer(f)
-        writer.writerow(fields)
-        writer.writerow(['', '', '', '', '', fasta_read_counts])
-        for i in peaks_list:
-            writer.writerow(i)
 
-def get_peaks_cli(results_dict, original_record_dict, fasta_read_counts, fasta_file_name, db_file_name):
-    peaks_list = []
-    out_file = f"Output/Data/{fasta_file_name}({db_file_name}).csv"
-    for key, val in results_dict.items():
-        standard_deviation = np.std(val)
-        peaks, _ = find_peaks(val, prominence=standard_deviation*0.85, distance=18)
-        t = val
-        for i in peaks:
-            rpm = (val[i]/fasta_read_counts)*1000000
-            round_rpm = round(rpm, 4)
-            if round_rpm > 5.0:
-                peak_slice = val_check(val, i, (val[i]-(standard_deviation*0.1)))
-                peak_start = peak_slice[0]
-                peak_end = peak_slice[-1] + 18
-                peak_string = original_record_dict[key][peak_start:peak_end]
-                temp = [key, round_rpm, peak_start, peak_end, peak_string, '', out_file]
-                peaks_list.append(temp)
-            else:
-                continue
+def get_peaks(results_dict, original_record_dict, fasta_read_counts, fasta_file_name, db_file_name, out_dir=""):
+    out_file = os.path.join(out_dir, f"{fasta_file_name}({db_file_name}).csv")
 
-    with open(out_file, 'w') as f:
+    # Rows are streamed into the buffered file as each key's peaks come back
+    with open(out_file, 'w', buffering=1<<20, newline='') as f:
         fields = ['miRNA ID', 'Reads per Million', 'Peak Start', 'Peak End', 'Peak Data', 'Total Reads in NGS File', 'File Name']
         writer = csv.writer(f)
         writer.writerow(fields)
         writer.writerow(['', '', '', '', '', fasta_read_counts])
-        for i in peaks_list:
-            writer.writerow(i)
-
-
+        for key, rpms, starts, ends, seqs in collect_peaks(results_dict, original_record_dict, np.divide(1_000_000.0, fasta_read_counts)):
+            writer.writerows(peak_rows(key, rpms, starts, ends, seqs, out_file))
 
+def get_peaks_cli(results_dict, original_record_dict, fasta_read_counts, fasta_file_name, db_file_name):
+    get_peaks(results_dict, original_record_dict, fasta_read_counts, fasta_file_name, db_file_name, out_dir="Output/Data")
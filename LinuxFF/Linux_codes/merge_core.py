@@ -82,16 +82,48 @@ def init_group():
                 f.write(f'Group {idx},{item["miRNA ID"]},{item["Peak Start"]},{item["Peak End"]}, {item["Reads per Million"]}, {item["File Name"]}\n')
 
 
+# Lazy view of the FASTA database: records are read from disk when looked up instead of all loaded up front
+class FastaIndex:
+    def __init__(self, db):
+        self.seqs = {}
+        self.duplicates = []
+        try:
+            self.index = SeqIO.index(db, "fasta")
+        except ValueError:
+            # SeqIO.index refuses repeated IDs. If that's the cause, load the whole file like before
+            # (last non-empty record wins) and keep the repeated IDs for the caller to report.
+            self.index = None
+            seen = set()
+            repeated = set()
+            with open(db, 'r') as f:
+                for record in SeqIO.parse(f, "fasta"):
+                    if record.id in seen:
+                        repeated.add(record.id)
+                    seen.add(record.id)
+                    s = str(record.seq)
+                    if len(s) > 0:
+                        self.seqs[record.id] = s
+            if not repeated:
+                raise
+            self.duplicates = sorted(repeated)
+
+    # Only records that actually have peaks get read, and each is read once
+    def __getitem__(self, id):
+        if id not in self.seqs:
+            if self.index is None:
+                raise KeyError(id)
+            self.seqs[id] = str(self.index[id].seq)
+        return self.seqs[id]
+
+    # Release the open FASTA handle held by the index
+    def close(self):
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+
 def get_orig_strings(db):
-    records = {}
-    with open(db, 'r') as f:
-        for record in SeqIO.parse(f, "fasta"):
-            s = str(record.seq)
-            if len(s) > 0:
-                records[record.id] = s
-            else:
-                continue
-    return records
+    return FastaIndex(db)
 
 
 def final_group(group, arg2):
@@ -129,7 +161,7 @@ def get_final_group(hmap):
     # final_frame = grouped_df.groupby(['Peak Group', 'miRNA ID']).apply(final_group)
     grouped.to_csv('tmp/files_and_reads.csv', index=False)
 
-def export_final_csv(count, fname):
+def export_final_csv(count, fname, progress_cb=None):
     # Read the CSV file into a DataFrame
     csv_file = 'tmp/files_and_reads.csv'  # Replace with your actual CSV file path
     original = pd.read_csv(csv_file)
@@ -179,7 +211,16 @@ def export_final_csv(count, fname):
     final_df = final_df.drop(columns=['Files : Reads'])
     final_df.insert(count+3, 'Peak Data', extracted_col)
     final_df = final_df.sort_values(by=['miRNA ID', 'Peak Start'])
-    final_df.to_csv(f'Joined_Outputs/{fname}.csv', index=False)
+
+    # Write in blocks of rows so callers can report progress over the 85-100% range
+    chunk_size = 10_000
+    total = len(final_df)
+    with open(f'Joined_Outputs/{fname}.csv', 'w', buffering=1<<20, newline='') as f:
+        final_df.iloc[:0].to_csv(f, index=False)
+        for start in range(0, total, chunk_size):
+            final_df.iloc[start:start+chunk_size].to_csv(f, index=False, header=False)
+            if progress_cb is not None:
+                progress_cb(85 + (15*min(start+chunk_size, total))//total)
 
 
 
@@ -208,8 +249,13 @@ def main():
     init_group()
 
     hmap = get_orig_strings(db_file_path)
+    if hmap.duplicates:
+        print(f"{len(hmap.duplicates)} duplicate record IDs in database (e.g. {hmap.duplicates[0]}); loaded without an index, last record wins")
 
-    get_final_group(hmap)
+    try:
+        get_final_group(hmap)
+    finally:
+        hmap.close()
 
     export_final_csv(file_count, out_file)
 
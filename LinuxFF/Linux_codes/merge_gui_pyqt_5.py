@@ -11,9 +11,9 @@ that exposes the following functions (adapt names if yours differ):
   - get_list_count(file_list) -> int
   - merge_files(dir_path) -> None
   - init_group() -> None
-  - get_orig_strings(fasta_path) -> dict
-  - get_final_group(hmap: dict) -> None
-  - export_final_csv(file_count: int, out_file: str) -> None
+  - get_orig_strings(fasta_path) -> mapping of record id to sequence string, with close() and .duplicates
+  - get_final_group(hmap) -> None
+  - export_final_csv(file_count: int, out_file: str, progress_cb=None) -> None
 
 Build (Linux, PyQt5):
   # optional: create a clean env
@@ -100,16 +100,21 @@ class MergeWorker(QtCore.QObject):
             core.init_group()
 
             self.progressed.emit(55)
-            self.log.emit("Loading FASTA database (Bio.SeqIO)…")
+            self.log.emit("Indexing FASTA database (Bio.SeqIO)…")
             hmap = core.get_orig_strings(self.fasta_path)
+            if hmap.duplicates:
+                self.log.emit(f"⚠️ {len(hmap.duplicates)} duplicate record IDs in FASTA (e.g. {hmap.duplicates[0]}); loaded without an index, last record wins")
 
             self.progressed.emit(70)
             self.log.emit("Computing final groups…")
-            core.get_final_group(hmap)
+            try:
+                core.get_final_group(hmap)
+            finally:
+                hmap.close()
 
             self.progressed.emit(85)
             self.log.emit("Exporting final CSV…")
-            core.export_final_csv(file_count, out_file)
+            core.export_final_csv(file_count, out_file, self.progressed.emit)
 
             # best-effort cleanup
             for p in ["tmp/files_and_reads.csv", "tmp/grouped_by_peak.csv", "tmp/t1.csv"]:
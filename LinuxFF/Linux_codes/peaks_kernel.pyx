@@ -0,0 +1,98 @@
+import numpy as np
+import cython
+from libc.math cimport sqrt
+from libc.stdint cimport uint64_t
+from libc.string cimport memcpy
+
+# One-pass (Welford) population standard deviation, same result as np.std
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+cpdef double welford_std(const double[::1] val):
+    cdef Py_ssize_t i
+    cdef Py_ssize_t n = val.shape[0]
+    cdef double mean = 0.0
+    cdef double m2 = 0.0
+    cdef double delta
+    if n == 0:
+        return 0.0
+    with nogil:
+        for i in range(n):
+            delta = val[i] - mean
+            mean += delta / (i + 1)
+            m2 += delta * (val[i] - mean)
+    return sqrt(m2 / n)
+
+cdef extern from *:
+    int __builtin_ctzll(unsigned long long) nogil
+
+# Eight set bytes, what a block of 0/1 comparison results looks like when every value passes
+cdef uint64_t ALL_TRUE = 0x0101010101010101
+
+# Index of the first zero byte in a 0/1 byte mask, or n if there is none.
+# Scans 8 bytes per step: XOR leaves a set bit only in failing bytes, ctz finds the first (little-endian).
+cdef inline Py_ssize_t first_false_u64(const unsigned char* m, Py_ssize_t n) noexcept nogil:
+    cdef Py_ssize_t i = 0
+    cdef uint64_t word
+    while i + 8 <= n:
+        memcpy(&word, m + i, 8)
+        word ^= ALL_TRUE
+        if word != 0:
+            return i + (__builtin_ctzll(word) >> 3)
+        i += 8
+    while i < n:
+        if m[i] == 0:
+            return i
+        i += 1
+    return n
+
+# Walk out from idx while the signal stays above thr, right side capped at max_right.
+# Each side fills an 8-byte 0/1 mask with a branch-free compare loop (all compares in the block run),
+# bit-scans it for the first failing byte, and stops at the first block that holds one.
+cdef inline void grow(const double* arr, Py_ssize_t n, Py_ssize_t idx, double thr, Py_ssize_t max_right, Py_ssize_t* start, Py_ssize_t* end) noexcept nogil:
+    cdef unsigned char mask[8]
+    cdef Py_ssize_t j, count
+    cdef Py_ssize_t lo = idx
+    cdef Py_ssize_t hi = idx
+    cdef Py_ssize_t stop = min(n, idx + 1 + max_right)
+    while lo > 0:
+        count = min(lo, 8)
+        for j in range(count):
+            mask[j] = arr[lo-1-j] > thr
+        j = first_false_u64(mask, count)
+        lo -= j
+        if j < count:
+            break
+    while hi + 1 < stop:
+        count = min(stop - hi - 1, 8)
+        for j in range(count):
+            mask[j] = arr[hi+1+j] > thr
+        j = first_false_u64(mask, count)
+        hi += j
+        if j < count:
+            break
+    start[0] = lo
+    end[0] = hi
+
+# Grow every peak of one key in a single GIL-free sweep, each against its own height minus thr_offset
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cpdef tuple peak_bounds(const double[::1] arr, const Py_ssize_t[::1] peaks, double thr_offset, Py_ssize_t max_right=10):
+    cdef Py_ssize_t k, idx, start, end
+    cdef Py_ssize_t num_peaks = peaks.shape[0]
+    starts_arr = np.empty(num_peaks, dtype=np.int32)
+    ends_arr = np.empty(num_peaks, dtype=np.int32)
+    cdef int[::1] starts = starts_arr
+    cdef int[::1] ends = ends_arr
+    if num_peaks == 0:
+        return starts_arr, ends_arr
+    for k in range(num_peaks):
+        if peaks[k] < 0 or peaks[k] >= arr.shape[0]:
+            raise IndexError(f"peak index {peaks[k]} out of range for length {arr.shape[0]}")
+    with nogil:
+        for k in range(num_peaks):
+            idx = peaks[k]
+            grow(&arr[0], arr.shape[0], idx, arr[idx] - thr_offset, max_right, &start, &end)
+            starts[k] = <int>start
+            ends[k] = <int>end
+    return starts_arr, ends_arr
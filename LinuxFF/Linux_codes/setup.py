@@ -1,10 +1,17 @@
-from setuptools import setup
+from setuptools import setup, Extension
 from Cython.Build import cythonize
 #import numpy
 
 import Cython.Compiler.Options
 Cython.Compiler.Options.annotate = True
 
+# Util.py is compiled as-is; uncompiled, or without peaks_kernel, it falls back to NumPy versions of the kernels
+extensions = [
+    Extension("Procedure", ["Procedure.pyx"], extra_compile_args=["-O3"]),
+    Extension("peaks_kernel", ["peaks_kernel.pyx"], extra_compile_args=["-O3"]),
+    Extension("Util", ["Util.py"], extra_compile_args=["-O3"]),
+]
+
 setup(
-    ext_modules=cythonize("Procedure.pyx", annotate = True)
+    ext_modules=cythonize(extensions, language_level=3, annotate = True)
 )
\ No newline at end of file